@@ -1,24 +1,40 @@
-import base64
-import uuid
+import binascii
+import secrets
 
 from django.core.files.base import ContentFile
 from rest_framework import serializers
 
+from recipes.constants import MAX_IMAGE_SIZE
+
 
 class Base64ImageField(serializers.ImageField):
-    """Кастомное поле для изображений в base64"""
+    """Кастомное поле для обработки Base64 изображений"""
 
     def to_internal_value(self, data):
-        # Проверяем, что это base64 строка
         if isinstance(data, str) and data.startswith('data:image'):
-            # Извлекаем формат и данные
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
+            header, _, imgstr = data.partition(';base64,')
+            ext = header.rpartition('/')[2]
 
-            # Генерируем имя файла
-            filename = f'{uuid.uuid4()}.{ext}'
+            # Проверяем размер до декодирования, чтобы не держать
+            # в памяти заведомо слишком большое изображение
+            if len(imgstr) * 3 // 4 > MAX_IMAGE_SIZE:
+                raise serializers.ValidationError(
+                    'Размер изображения не должен превышать '
+                    f'{MAX_IMAGE_SIZE // (1024 * 1024)} МБ'
+                )
+            try:
+                # b64decode лишь оборачивает a2b_base64, вызываем его напрямую
+                decoded = binascii.a2b_base64(imgstr)
+            except ValueError:
+                # binascii.Error - подкласс ValueError, а не-ASCII символы
+                # дают сам ValueError
+                raise serializers.ValidationError(
+                    'Некорректные данные изображения'
+                )
 
-            # Декодируем base64
-            data = ContentFile(base64.b64decode(imgstr), name=filename)
+            data = ContentFile(
+                decoded,
+                name=f'{secrets.token_hex(5)}.{ext}'
+            )
 
         return super().to_internal_value(data)
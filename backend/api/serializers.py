@@ -1,15 +1,14 @@
-import base64
-import uuid
-from collections import Counter
-
 from django.contrib.auth import get_user_model
-from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch, Value
 from djoser.serializers import UserSerializer as BaseUserSerializer
 from rest_framework import serializers
 
-from recipes.constants import MIN_AMOUNT
+from recipes.constants import BULK_CREATE_BATCH_SIZE, MIN_AMOUNT
 from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
                             ShoppingCart, Subscription, Tag)
+from recipes.utils import count_related
+from .fields import Base64ImageField
 
 User = get_user_model()
 
@@ -30,27 +29,10 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit')
 
 
-class Base64ImageField(serializers.ImageField):
-    """Кастомное поле для обработки Base64 изображений"""
-
-    def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-
-            data = ContentFile(
-                base64.b64decode(imgstr),
-                name=f'{uuid.uuid4().hex[:10]}.{ext}'
-            )
-
-        return super().to_internal_value(data)
-
-
 class IngredientInRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для отображения ингредиентов в рецепте"""
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all()
-    )
+    # Продукты по id находятся одним запросом в validate_ingredients
+    id = serializers.IntegerField()
     measurement_unit = serializers.CharField(
         source='ingredient.measurement_unit',
         read_only=True
@@ -84,34 +66,47 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         )
 
     @staticmethod
-    def find_duplicates(items, get_id_func=lambda x: x):
-        """Находит дублирующиеся элементы"""
-        return {
-            item_id for item_id, count in Counter(
-                get_id_func(item) for item in items
-            ).items() if count > 1
-        }
-
-    def _validate_no_duplicates(self, data, model, field_name, id_func):
+    def find_duplicates(items, get_object_func=lambda x: x):
+        """Находит дублирующиеся объекты за один проход: {id: объект}"""
+        seen = set()
+        duplicates = {}
+        for item in items:
+            obj = get_object_func(item)
+            if obj.pk in seen:
+                duplicates[obj.pk] = obj
+            else:
+                seen.add(obj.pk)
+        return duplicates
+
+    def _validate_no_duplicates(self, data, field_name, get_object_func):
         """Общая функция для проверки дубликатов"""
-        duplicates = self.find_duplicates(data, get_id_func=id_func)
+        duplicates = self.find_duplicates(data, get_object_func)
 
         if duplicates:
-            duplicate_names = model.objects.filter(
-                id__in=duplicates
-            ).values_list('name', flat=True)
+            # Объекты уже получены полем сериализатора, повторный запрос
+            # к базе для имен не нужен
+            duplicate_names = sorted(obj.name for obj in duplicates.values())
             raise serializers.ValidationError(
                 f'{field_name} не должны повторяться. '
-                f'Дублируются: {list(duplicate_names)}'
+                f'Дублируются: {duplicate_names}'
             )
 
         return data
 
     def validate_ingredients(self, ingredients_data):
-        """Проверяем что ингредиенты не повторяются"""
+        """Проверяем что ингредиенты существуют и не повторяются"""
+        ingredient_ids = {item['id'] for item in ingredients_data}
+        ingredients = Ingredient.objects.in_bulk(ingredient_ids)
+        missing_ids = sorted(ingredient_ids - ingredients.keys())
+        if missing_ids:
+            raise serializers.ValidationError(
+                f'Продукты не найдены: {missing_ids}'
+            )
+        for item in ingredients_data:
+            item['id'] = ingredients[item['id']]
+
         return self._validate_no_duplicates(
             ingredients_data,
-            Ingredient,
             'Продукты',
             lambda x: x['id']
         )
@@ -120,21 +115,56 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
         """Проверяем что теги не повторяются"""
         return self._validate_no_duplicates(
             tags_data,
-            Tag,
             'Теги',
-            lambda x: x.id
+            lambda x: x
         )
 
     def create_ingredients(self, recipe, ingredients):
         """Создаем связи рецепта с ингредиентами"""
         IngredientAmount.objects.bulk_create(
-            IngredientAmount(
-                recipe=recipe,
-                ingredient=ingredient['id'],
-                amount=ingredient['amount']
-            ) for ingredient in ingredients
+            [
+                IngredientAmount(
+                    recipe=recipe,
+                    ingredient=ingredient['id'],
+                    amount=ingredient['amount']
+                ) for ingredient in ingredients
+            ],
+            batch_size=BULK_CREATE_BATCH_SIZE
+        )
+
+    def update_ingredients(self, recipe, ingredients):
+        """Обновляем связи рецепта с ингредиентами по разнице со старыми"""
+        # Читаем связи заново после блокировки рецепта: подгруженные
+        # get_object() до начала транзакции могли устареть
+        existing = {
+            ingredient_amount.ingredient_id: ingredient_amount
+            for ingredient_amount in IngredientAmount.objects.filter(
+                recipe=recipe
+            )
+        }
+        to_create = []
+        to_update = []
+        for ingredient in ingredients:
+            ingredient_amount = existing.pop(ingredient['id'].pk, None)
+            if ingredient_amount is None:
+                to_create.append(ingredient)
+            elif ingredient_amount.amount != ingredient['amount']:
+                ingredient_amount.amount = ingredient['amount']
+                to_update.append(ingredient_amount)
+
+        # Все, что осталось в existing, из рецепта убрали
+        if existing:
+            IngredientAmount.objects.filter(
+                id__in=[item.id for item in existing.values()]
+            ).delete()
+        IngredientAmount.objects.bulk_update(to_update, ('amount',))
+        self.create_ingredients(recipe, to_create)
+        # Сбрасываем подгруженные ранее ингредиенты, они устарели
+        getattr(recipe, '_prefetched_objects_cache', {}).pop(
+            'ingredient_amounts', None
         )
 
+    @transaction.atomic
     def create(self, validated_data):
         """Создание рецепта с ингредиентами и тегами"""
         validated_data['author'] = self.context['request'].user
@@ -148,24 +178,28 @@ class RecipeCreateUpdateSerializer(serializers.ModelSerializer):
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         """Обновление рецепта с ингредиентами и тегами"""
+        # Блокируем строку рецепта до конца транзакции
+        Recipe.objects.select_for_update().only('pk').get(pk=instance.pk)
         ingredients = validated_data.pop('ingredients', None)
         tags = validated_data.pop('tags', None)
 
         # Обновляем теги если переданы
-        instance.tags.set(tags)
+        if tags is not None:
+            instance.tags.set(tags)
 
         # Обновляем ингредиенты если переданы
-        instance.ingredient_amounts.all().delete()
-        self.create_ingredients(instance, ingredients)
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
 
         return super().update(instance, validated_data)
 
 
 class UserSerializer(BaseUserSerializer):
     """Сериализатор для получения данных пользователя"""
-    is_subscribed = serializers.SerializerMethodField()
+    is_subscribed = serializers.BooleanField(read_only=True, default=False)
 
     class Meta(BaseUserSerializer.Meta):
         model = User
@@ -176,32 +210,30 @@ class UserSerializer(BaseUserSerializer):
         )
         read_only_fields = fields
 
-    def get_is_subscribed(self, user):
-        """Проверяет, подписан ли текущий пользователь на кого-то"""
-        request = self.context.get('request')
-
-        if request and request.user.is_authenticated:
-            return Subscription.objects.filter(
-                user=request.user,
-                author=user
-            ).exists()
-        return False
+    @classmethod
+    def annotate_queryset(cls, queryset, user):
+        """Добавляет флаг подписки текущего пользователя на каждого автора"""
+        if not user.is_authenticated:
+            return queryset.annotate(is_subscribed=Value(False))
+        return queryset.annotate(is_subscribed=Exists(
+            Subscription.objects.filter(user=user, author=OuterRef('pk'))
+        ))
 
 
 class RecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для отображения рецепта"""
-    tags = TagSerializer(
-        many=True,
-        read_only=True
-    )
+    tags = serializers.SerializerMethodField()
     author = UserSerializer(read_only=True)
     ingredients = IngredientInRecipeSerializer(
         source='ingredient_amounts',
         many=True,
         read_only=True
     )
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
+    is_favorited = serializers.BooleanField(read_only=True, default=False)
+    is_in_shopping_cart = serializers.BooleanField(
+        read_only=True,
+        default=False
+    )
 
     class Meta:
         model = Recipe
@@ -212,27 +244,54 @@ class RecipeSerializer(serializers.ModelSerializer):
         )
         read_only_fields = ('id', 'is_subscribed')
 
-    def _check_relation(self, recipe, relation_model):
-        """Общий метод для проверки связи пользователь-рецепт"""
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return relation_model.objects.filter(
-                user=request.user,
-                recipe=recipe
-            ).exists()
-        return False
-
-    def get_is_favorited(self, recipe):
-        """Проверяет, в избранном ли рецепт"""
-        return self._check_relation(recipe, Favorite)
-
-    def get_is_in_shopping_cart(self, recipe):
-        """Проверяет, в корзине ли рецепт"""
-        return self._check_relation(recipe, ShoppingCart)
+    @staticmethod
+    def _relation_exists(relation_model, user):
+        """Подзапрос для проверки связи пользователь-рецепт"""
+        if not user.is_authenticated:
+            return Value(False)
+        return Exists(relation_model.objects.filter(
+            user=user,
+            recipe=OuterRef('pk')
+        ))
+
+    def get_tags(self, recipe):
+        """Теги рецепта, каждый тег сериализуется один раз за запрос"""
+        serialized_tags = self.context.setdefault('serialized_tags', {})
+        result = []
+        for tag in recipe.tags.all():
+            if tag.pk not in serialized_tags:
+                serialized_tags[tag.pk] = TagSerializer(tag).data
+            result.append(serialized_tags[tag.pk])
+        return result
+
+    @classmethod
+    def prefetch_queryset(cls, queryset, user):
+        """Подгружает связанные объекты и флаги, нужные для отображения"""
+        return queryset.prefetch_related(
+            Prefetch(
+                'author',
+                # Пароль и служебные поля автора для отображения не нужны
+                queryset=UserSerializer.annotate_queryset(
+                    User.objects.only(
+                        'id', 'email', 'username',
+                        'first_name', 'last_name', 'avatar'
+                    ),
+                    user
+                )
+            ),
+            'tags',
+            Prefetch(
+                'ingredient_amounts',
+                queryset=IngredientAmount.objects.select_related('ingredient')
+            )
+        ).annotate(
+            is_favorited=cls._relation_exists(Favorite, user),
+            is_in_shopping_cart=cls._relation_exists(ShoppingCart, user)
+        )
 
 
 class RecipeMinifiedSerializer(serializers.ModelSerializer):
-    """Упрощенный сериализатор рецепта для подписок"""
+    """Упрощенный сериализатор рецепта для подписок, избранного и корзины"""
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'image', 'cooking_time')
@@ -242,10 +301,7 @@ class RecipeMinifiedSerializer(serializers.ModelSerializer):
 class UserWithRecipesSerializer(UserSerializer):
     """Сериализатор пользователя с рецептами для подписок"""
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(
-        source='recipes.count',
-        read_only=True
-    )
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta(UserSerializer.Meta):
         model = User
@@ -254,24 +310,38 @@ class UserWithRecipesSerializer(UserSerializer):
             + ('recipes', 'recipes_count')
         )
 
-    def get_recipes(self, obj):
-        """Возвращает рецепты пользователя с лимитом"""
-        request = self.context.get('request')
-        recipes_limit = (
-            request.query_params.get('recipes_limit')
-            if request
-            else None
+    @classmethod
+    def annotate_queryset(cls, queryset, user, recipes_limit=None):
+        """Добавляет флаг подписки, количество и список рецептов автора"""
+        recipes = Recipe.objects.only(
+            'id', 'author', 'name', 'image', 'cooking_time'
         )
-
-        recipes = obj.recipes.all()
-
         if recipes_limit:
-            try:
-                recipes = recipes[:int(recipes_limit)]
-            except ValueError:
-                pass
+            # Лимит применяется в базе для каждого автора отдельно
+            recipes = recipes[:recipes_limit]
+        # Подзапрос вместо Count() через JOIN: пагинатор считает
+        # подписки без соединения с рецептами и группировки
+        return super().annotate_queryset(queryset, user).annotate(
+            recipes_count=count_related(Recipe, 'author')
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        )
+
+    @staticmethod
+    def parse_recipes_limit(request):
+        """Лимит рецептов из параметров запроса"""
+        if not request:
+            return None
+        try:
+            recipes_limit = int(request.query_params['recipes_limit'])
+        except (KeyError, ValueError):
+            return None
+        return recipes_limit if recipes_limit > 0 else None
 
-        return RecipeMinifiedSerializer(recipes, many=True,
+    def get_recipes(self, obj):
+        """Возвращает рецепты пользователя с лимитом"""
+        # Рецепты подгружены заранее, лимит уже применен в базе
+        return RecipeMinifiedSerializer(obj.limited_recipes, many=True,
                                         context=self.context).data
 
 
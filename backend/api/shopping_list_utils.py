@@ -1,11 +1,8 @@
-from django.utils import timezone
+from functools import lru_cache
 
+from django.utils import timezone
+from django.utils.formats import date_format
 
-RUSSIAN_MONTHS = {
-    1: 'января', 2: 'февраля', 3: 'марта', 4: 'апреля',
-    5: 'мая', 6: 'июня', 7: 'июля', 8: 'августа',
-    9: 'сентября', 10: 'октября', 11: 'ноября', 12: 'декабря'
-}
 
 UNIT_FORMS = {
     'стакан': {'one': 'стакан', 'few': 'стакана', 'many': 'стаканов'},
@@ -26,6 +23,7 @@ UNIT_FORMS = {
 }
 
 
+@lru_cache(maxsize=1024)
 def get_correct_unit_form(amount, unit):
     """Возвращает правильную форму единицы измерения"""
     if unit not in UNIT_FORMS:
@@ -39,45 +37,49 @@ def get_correct_unit_form(amount, unit):
         return UNIT_FORMS[unit]['many']
 
 
-INGREDIENT_FORMAT = "📌 {idx}. {name} - {total_amount} {unit}"
-RECIPE_FORMAT = "🍽️ {idx}. {name} (автор: @{author})"
+# %-шаблоны разбираются быстрее, чем str.format с именованными полями
+INGREDIENT_FORMAT = '📌 %d. %s - %s %s\n'
+RECIPE_FORMAT = '🍽️ %d. %s (автор: @%s)\n'
 SEPARATOR = '-' * 50
 
 
 def generate_shopping_list_content(ingredients, recipes):
-    """Генерирует содержимое списка покупок"""
-    current_date = timezone.now()
-    day = current_date.day
-    month = RUSSIAN_MONTHS[current_date.month]
-    year = current_date.year
+    """
+    Построчно генерирует содержимое списка покупок.
+    Ингредиенты и рецепты проходятся один раз, поэтому подходят
+    любые итерируемые объекты, в том числе queryset.iterator().
+    """
+    # Месяц в родительном падеже берется из локализации Django
+    current_date = date_format(timezone.now(), 'j E Y')
+
+    yield (
+        f'{SEPARATOR}\n'
+        '🛒 Foodgram - Список покупок\n'
+        f'📅 Дата составления: {current_date}\n'
+        f'{SEPARATOR}\n'
+        'Ингредиенты:\n'
+    )
+    ingredients_count = 0
+    for ingredients_count, item in enumerate(ingredients, 1):
+        yield INGREDIENT_FORMAT % (
+            ingredients_count,
+            ' '.join(item['name'].split()).capitalize(),
+            item['total_amount'],
+            get_correct_unit_form(item['total_amount'], item['unit'])
+        )
+
+    yield f'{SEPARATOR}\nРецепты:\n'
+    recipes_count = 0
+    for recipes_count, recipe in enumerate(recipes, 1):
+        yield RECIPE_FORMAT % (
+            recipes_count,
+            recipe['name'],
+            recipe['author_username']
+        )
 
-    return '\n'.join([
-        SEPARATOR,
-        '🛒 Foodgram - Список покупок',
-        f'📅 Дата составления: {day} {month} {year}',
-        SEPARATOR,
-        'Ингредиенты:',
-        *[
-            INGREDIENT_FORMAT.format(
-                idx=idx,
-                name=' '.join(item['name'].split()).capitalize(),
-                total_amount=item['total_amount'],
-                unit=get_correct_unit_form(item['total_amount'], item['unit'])
-            )
-            for idx, item in enumerate(ingredients, 1)
-        ],
-        SEPARATOR,
-        'Рецепты:',
-        *[
-            RECIPE_FORMAT.format(
-                idx=idx,
-                name=recipe.name,
-                author=recipe.author.username
-            )
-            for idx, recipe in enumerate(recipes, 1)
-        ],
-        SEPARATOR,
-        f'\nВсего ингредиентов: {len(ingredients)}',
-        f'Всего рецептов: {len(recipes)}\n',
-        SEPARATOR
-    ])
+    yield (
+        f'{SEPARATOR}\n'
+        f'\nВсего ингредиентов: {ingredients_count}\n'
+        f'Всего рецептов: {recipes_count}\n\n'
+        f'{SEPARATOR}'
+    )
@@ -1,9 +1,10 @@
-import base64
-import uuid
+from functools import lru_cache
+from hashlib import md5
+from uuid import uuid4
 
 from django.contrib.auth import get_user_model
-from django.core.files.base import ContentFile
-from django.db.models import F, Sum
+from django.core.cache import cache
+from django.db.models import Exists, F, OuterRef, Sum
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from django_filters.rest_framework import (DjangoFilterBackend, FilterSet,
@@ -13,15 +14,20 @@ from rest_framework.decorators import action
 from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
-from django.http import Http404
-from django.http import FileResponse
+from django.http import StreamingHttpResponse
 from django.urls import reverse
 
+from recipes.constants import (INGREDIENTS_CACHE_VERSION_KEY,
+                               ITERATOR_CHUNK_SIZE, LIST_CACHE_TIMEOUT,
+                               MAX_AVATAR_B64, TAGS_CACHE_VERSION_KEY)
 from recipes.models import (Favorite, Ingredient, IngredientAmount, Recipe,
                             ShoppingCart, Subscription, Tag)
+from recipes.views import check_recipe_exists
 from .permission import IsAuthorOrReadOnly
-from .serializers import (IngredientSerializer, RecipeCreateUpdateSerializer,
-                          RecipeSerializer, TagSerializer,
+from .serializers import (AvatarSerializer, IngredientSerializer,
+                          RecipeCreateUpdateSerializer,
+                          RecipeMinifiedSerializer, RecipeSerializer,
+                          TagSerializer, UserSerializer,
                           UserWithRecipesSerializer)
 from .shopping_list_utils import generate_shopping_list_content
 
@@ -29,11 +35,70 @@ from .shopping_list_utils import generate_shopping_list_content
 User = get_user_model()
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+@lru_cache(maxsize=None)
+def get_short_link_template():
+    """Шаблон короткой ссылки, URL-резолвер проходится один раз"""
+    return reverse(
+        'recipes:recipe-short-link', kwargs={'pk': 0}
+    ).replace('/0/', '/{pk}/')
+
+
+class QueryParamsFilterBackend(DjangoFilterBackend):
+    """
+    Бэкенд фильтрации, который не создает FilterSet,
+    если в запросе нет ни одного параметра фильтра.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        filterset_class = self.get_filterset_class(view, queryset)
+        if filterset_class is None:
+            return queryset
+        filter_params = set(filterset_class.base_filters).union(
+            getattr(filterset_class, 'param_aliases', ())
+        )
+        if not request.query_params.keys() & filter_params:
+            return queryset
+        return super().filter_queryset(request, queryset, view)
+
+
+class VersionedCacheMixin:
+    """
+    Кэширует данные list и retrieve под ключом с версией.
+    Сигналы удаляют версию при изменении модели, после чего
+    все сохраненные ранее ответы перестают использоваться.
+    """
+    cache_version_key = None
+
+    def get_cached_data(self, request, build_data):
+        version = cache.get_or_set(
+            self.cache_version_key, lambda: uuid4().hex, None
+        )
+        cache_key = '{}:{}:{}'.format(
+            self.cache_version_key,
+            version,
+            md5(request.get_full_path().encode()).hexdigest()
+        )
+        return cache.get_or_set(cache_key, build_data, LIST_CACHE_TIMEOUT)
+
+    def list(self, request, *args, **kwargs):
+        parent = super()
+        return Response(self.get_cached_data(
+            request, lambda: parent.list(request, *args, **kwargs).data
+        ))
+
+    def retrieve(self, request, *args, **kwargs):
+        parent = super()
+        return Response(self.get_cached_data(
+            request, lambda: parent.retrieve(request, *args, **kwargs).data
+        ))
+
+
+class TagViewSet(VersionedCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     Вьюсет для тегов.
     Только чтение (list и retrieve).
     """
+    cache_version_key = TAGS_CACHE_VERSION_KEY
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
@@ -44,23 +109,33 @@ class IngredientFilter(FilterSet):
     Вьюсет для фильтрации ингредиентов.
     """
     name = CharFilter(field_name='name', lookup_expr='istartswith')
-    search = CharFilter(field_name='name', lookup_expr='istartswith')
-    q = CharFilter(field_name='name', lookup_expr='istartswith')
+    # Синонимы параметра name, поддерживаемые для совместимости
+    param_aliases = ('search', 'q')
 
     class Meta:
         model = Ingredient
         fields = ('name',)
 
+    def __init__(self, data=None, *args, **kwargs):
+        if data is not None and not data.get('name'):
+            for alias in self.param_aliases:
+                if data.get(alias):
+                    data = data.copy()
+                    data['name'] = data[alias]
+                    break
+        super().__init__(data, *args, **kwargs)
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+
+class IngredientViewSet(VersionedCacheMixin, viewsets.ReadOnlyModelViewSet):
     """
     Вьюсет для ингредиентов.
     Только чтение с поиском по имени.
     """
+    cache_version_key = INGREDIENTS_CACHE_VERSION_KEY
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
-    filter_backends = (DjangoFilterBackend,)
+    filter_backends = (QueryParamsFilterBackend,)
     filterset_class = IngredientFilter
 
 
@@ -76,19 +151,32 @@ class RecipeFilter(FilterSet):
 
     def filter_is_favorited(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
-            return queryset.filter(favorite__user=self.request.user)
+            return queryset.filter(Exists(Favorite.objects.filter(
+                user=self.request.user,
+                recipe=OuterRef('pk')
+            )))
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
-            return queryset.filter(shoppingcart__user=self.request.user)
+            return queryset.filter(Exists(ShoppingCart.objects.filter(
+                user=self.request.user,
+                recipe=OuterRef('pk')
+            )))
         return queryset
 
     def filter_tags_by_slug(self, queryset, name, value):
         if value:
             tag_slugs = self.request.query_params.getlist('tags')
             if tag_slugs:
-                return queryset.filter(tags__slug__in=tag_slugs).distinct()
+                # Подзапрос вместо JOIN: строки рецептов не дублируются,
+                # и DISTINCT не нужен
+                return queryset.filter(Exists(
+                    Recipe.tags.through.objects.filter(
+                        recipe=OuterRef('pk'),
+                        tag__slug__in=tag_slugs
+                    )
+                ))
         return queryset
 
 
@@ -96,9 +184,24 @@ class RecipeViewSet(viewsets.ModelViewSet):
     """ViewSet для рецептов со всеми эндпоинтами из ТЗ"""
     queryset = Recipe.objects.all()
     permission_classes = [IsAuthorOrReadOnly]
-    filter_backends = (DjangoFilterBackend,)
+    filter_backends = (QueryParamsFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        """Связи и флаги избранного/корзины подгружаем только для чтения"""
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve'):
+            return RecipeSerializer.prefetch_queryset(
+                queryset, self.request.user
+            )
+        return queryset
+
+    def _get_recipe_for_response(self, pk):
+        """Рецепт со всеми связями для ответа после создания/обновления"""
+        return RecipeSerializer.prefetch_queryset(
+            Recipe.objects.all(), self.request.user
+        ).get(pk=pk)
+
     def get_serializer_class(self):
         """Выбираем сериализатор в зависимости от действия"""
         if self.action in ['create', 'update', 'partial_update']:
@@ -114,6 +217,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         instance = serializer.save(author=request.user)
+        # Перечитываем рецепт со всеми связями одним набором запросов
+        instance = self._get_recipe_for_response(instance.pk)
 
         output_serializer = RecipeSerializer(instance,
                                              context={'request': request})
@@ -138,6 +243,7 @@ class RecipeViewSet(viewsets.ModelViewSet):
                                          partial=partial)
         serializer.is_valid(raise_exception=True)
         instance = serializer.save()
+        instance = self._get_recipe_for_response(instance.pk)
 
         output_serializer = RecipeSerializer(instance,
                                              context={'request': request})
@@ -172,7 +278,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 f'{model_class._meta.verbose_name}'
             )
 
-        serializer = RecipeSerializer(recipe, context={'request': request})
+        serializer = RecipeMinifiedSerializer(
+            recipe,
+            context={'request': request}
+        )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @action(
@@ -204,8 +313,12 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
     def download_shopping_cart(self, request):
         """Скачивание списка покупок"""
+        # Рецепты корзины выбираются подзапросом по индексу корзины,
+        # без соединения с таблицей рецептов
         ingredients = IngredientAmount.objects.filter(
-            recipe__shoppingcart__user=request.user
+            recipe_id__in=ShoppingCart.objects.filter(
+                user=request.user
+            ).values('recipe_id')
         ).values(
             name=F('ingredient__name'),
             unit=F('ingredient__measurement_unit')
@@ -213,18 +326,28 @@ class RecipeViewSet(viewsets.ModelViewSet):
             total_amount=Sum('amount')
         ).order_by('name')
 
+        # Рецепт попадает в корзину пользователя не более одного раза
+        # (уникальность user+recipe), поэтому DISTINCT не нужен
         recipes = Recipe.objects.filter(
             shoppingcart__user=request.user
-        ).distinct().order_by('name')
-
-        file_content = generate_shopping_list_content(ingredients, recipes)
+        ).values(
+            'name',
+            author_username=F('author__username')
+        ).order_by('name')
 
-        return FileResponse(
-            file_content,
-            as_attachment=True,
-            filename='foodgram_shopping_list.txt',
-            content_type='text/plain'
+        # Суммирование и сортировка выполняются в базе, строки читаем
+        # курсором порциями и сразу отдаем клиенту
+        response = StreamingHttpResponse(
+            generate_shopping_list_content(
+                ingredients.iterator(chunk_size=ITERATOR_CHUNK_SIZE),
+                recipes.iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+            ),
+            content_type='text/plain; charset=utf-8'
+        )
+        response['Content-Disposition'] = (
+            'attachment; filename="foodgram_shopping_list.txt"'
         )
+        return response
 
     @action(
         methods=['get'],
@@ -234,12 +357,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
     )
     def get_link(self, request, pk=None):
         """Короткая ссылка на рецепт"""
-        if not Recipe.objects.filter(id=pk).exists():
-            raise Http404(f'Рецепт с id {pk} не найден')
-
+        check_recipe_exists(pk)
         return Response({
             'short-link': request.build_absolute_uri(
-                reverse('recipes:recipe-short-link', kwargs={'pk': pk})
+                get_short_link_template().format(pk=pk)
             )
         })
 
@@ -247,6 +368,18 @@ class RecipeViewSet(viewsets.ModelViewSet):
 class UserFoodgramViewSet(UserViewSet):
     """Кастомный вьюсет пользователя с дополнительными полями"""
 
+    def get_queryset(self):
+        """Пользователи с флагом подписки текущего пользователя"""
+        if self.action in ('subscriptions', 'subscribe'):
+            return UserWithRecipesSerializer.annotate_queryset(
+                super().get_queryset(),
+                self.request.user,
+                UserWithRecipesSerializer.parse_recipes_limit(self.request)
+            )
+        return UserSerializer.annotate_queryset(
+            super().get_queryset(), self.request.user
+        )
+
     @action(
         methods=["get"],
         detail=False,
@@ -255,9 +388,9 @@ class UserFoodgramViewSet(UserViewSet):
     def subscriptions(self, request):
         """Список моих подписок"""
         user = request.user
-        subscriptions = User.objects.filter(
+        subscriptions = self.get_queryset().filter(
             followings__user=user
-        )
+        ).order_by('email')
 
         # Пагинация
         page = self.paginate_queryset(subscriptions)
@@ -300,6 +433,7 @@ class UserFoodgramViewSet(UserViewSet):
             raise serializers.ValidationError(
                 f'Вы уже подписаны на пользователя {author.username}'
             )
+        author.is_subscribed = True
 
         serializer = UserWithRecipesSerializer(
             author, context={'request': request}
@@ -331,23 +465,20 @@ class UserFoodgramViewSet(UserViewSet):
                 avatar_file = request.FILES['avatar']
 
             elif 'avatar' in request.data:
+                # Заведомо слишком большие данные отклоняем сразу,
+                # не разбирая и не декодируя их
                 avatar_data = request.data['avatar']
-
                 if (isinstance(avatar_data, str)
-                        and avatar_data.startswith('data:image')):
-                    try:
-                        format, imgstr = avatar_data.split(';base64,')
-                        ext = format.split('/')[-1]
-                        filename = f"{uuid.uuid4()}.{ext}"
-                        avatar_file = ContentFile(
-                            base64.b64decode(imgstr),
-                            name=filename
-                        )
-                    except Exception:
-                        return Response(
-                            {'error': 'Invalid image format'},
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
+                        and len(avatar_data) > MAX_AVATAR_B64):
+                    return Response(
+                        {'error': 'Avatar is too large'},
+                        status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+                    )
+                # Base64 декодируется общим полем, которое проверяет размер
+                # до декодирования и валидирует изображение
+                serializer = AvatarSerializer(data=request.data)
+                serializer.is_valid(raise_exception=True)
+                avatar_file = serializer.validated_data['avatar']
 
             if not avatar_file:
                 return Response(
@@ -356,7 +487,7 @@ class UserFoodgramViewSet(UserViewSet):
                 )
 
             user.avatar = avatar_file
-            user.save()
+            user.save(update_fields=('avatar',))
 
             avatar_url = request.build_absolute_uri(user.avatar.url)
 
@@ -367,5 +498,6 @@ class UserFoodgramViewSet(UserViewSet):
 
         elif request.method == 'DELETE':
             if user.avatar:
-                user.avatar.delete(save=True)
+                user.avatar.delete(save=False)
+                user.save(update_fields=('avatar',))
             return Response(status=status.HTTP_204_NO_CONTENT)
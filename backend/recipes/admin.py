@@ -1,15 +1,89 @@
+from functools import lru_cache
+
 from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin
-from django.db.models import Count
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef, Prefetch
+from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 from django import forms
 
+from .constants import (AUTHOR_CHOICES_CACHE_KEY,
+                        AUTHOR_CHOICES_CACHE_TIMEOUT,
+                        MEASUREMENT_UNIT_CHOICES_CACHE_KEY,
+                        MEASUREMENT_UNIT_CHOICES_CACHE_TIMEOUT)
 from .models import (Favorite, Ingredient, IngredientAmount, Recipe,
                      ShoppingCart, Subscription, Tag)
+from .utils import count_related
 
 User = get_user_model()
 
+# Цветовая схема для конкретных тегов
+TAG_COLORS = {
+    'Завтрак': "#F4F80A",
+    'Обед': "#2BFF00",
+    'Перекус': "#00FFF7",
+    'Постное': "#44EC7C",
+    'Праздничное': "#FB03FF",
+    'Ужин': "#3A6BFE",
+    'Чаепитие': "#F48B62",
+}
+DEFAULT_TAG_COLOR = '#95a5a6'
+TAG_HTML_TEMPLATE = (
+    '<span style="background: {color}; color: #080707; '
+    'padding: 4px 8px; border-radius: 16px; font-size: 12px; '
+    'font-weight: 500; margin: 2px; display: inline-block; '
+    'border: 1px solid {color};">'
+    '{name}</span>'
+)
+
+INGREDIENT_HTML_TEMPLATE = '%s (%s %s)'
+
+
+@lru_cache(maxsize=256)
+def get_tag_html(name):
+    """HTML бейджа тега, собирается один раз для каждого названия"""
+    return TAG_HTML_TEMPLATE.format(
+        color=TAG_COLORS.get(name, DEFAULT_TAG_COLOR),
+        name=name
+    )
+
+
+@lru_cache(maxsize=256)
+def get_recipe_thumbnail_html(url, title):
+    """HTML миниатюры рецепта, собирается один раз для каждого файла"""
+    return format_html(
+        '<img src="{}" '
+        'style="height: 80px; width: 90px; object-fit: cover; '
+        'border-radius: 4px; border: 5px solid #87CEEB;" '
+        'title="{}" '
+        'onerror="this.style.display=\'none\'">',
+        url,
+        title
+    )
+
+
+@lru_cache(maxsize=256)
+def get_avatar_thumbnail_html(url):
+    """HTML аватара для списка пользователей"""
+    return format_html(
+        '<img src="{}" style="max-height: 120px;'
+        'max-width: 120px; border-radius: 50%; object-fit: cover;'
+        'border: 3px solid #8b5cf6;" />',
+        url
+    )
+
+
+@lru_cache(maxsize=256)
+def get_avatar_preview_html(url):
+    """HTML аватара для формы редактирования пользователя"""
+    return format_html(
+        '<img src="{}" style="max-height: 250px;'
+        'max-width: 150px; border-radius: 50%; object-fit: cover;"/>',
+        url
+    )
+
 
 class HasRecipesFilter(admin.SimpleListFilter):
     """Фильтр есть ли ингредиент в рецептах"""
@@ -24,10 +98,37 @@ class HasRecipesFilter(admin.SimpleListFilter):
         return self.LOOKUP_CHOICES
 
     def queryset(self, request, queryset):
+        in_recipes = Exists(
+            IngredientAmount.objects.filter(ingredient=OuterRef('pk'))
+        )
         if self.value() == 'yes':
-            return queryset.filter(ingredient_amounts__isnull=False).distinct()
+            return queryset.filter(in_recipes)
         if self.value() == 'no':
-            return queryset.filter(ingredient_amounts__isnull=True)
+            return queryset.filter(~in_recipes)
+        return queryset
+
+
+class MeasurementUnitFilter(admin.SimpleListFilter):
+    """Фильтр по единицам измерения"""
+    title = 'Единица измерения'
+    parameter_name = 'measurement_unit'
+
+    def lookups(self, request, model_admin):
+        """Возвращает список единиц измерения"""
+        # Единиц немного и они почти не меняются, список кэшируется
+        # и сбрасывается при изменении ингредиентов
+        return cache.get_or_set(
+            MEASUREMENT_UNIT_CHOICES_CACHE_KEY,
+            lambda: list(Ingredient.objects.order_by(
+                'measurement_unit'
+            ).values_list('measurement_unit', 'measurement_unit').distinct()),
+            MEASUREMENT_UNIT_CHOICES_CACHE_TIMEOUT
+        )
+
+    def queryset(self, request, queryset):
+        """Фильтрует по выбранной единице измерения"""
+        if self.value():
+            return queryset.filter(measurement_unit=self.value())
         return queryset
 
 
@@ -37,15 +138,17 @@ class IngredientAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'measurement_unit',
                     'recipes_count')
     list_display_links = ('name',)
-    list_filter = ('measurement_unit', HasRecipesFilter)
+    list_filter = (MeasurementUnitFilter, HasRecipesFilter)
+    show_full_result_count = False
     search_fields = ('name', 'measurement_unit')
     ordering = ('name',)
 
     def get_queryset(self, request):
         """Аннотируем queryset количеством рецептов"""
+        # Пара рецепт-ингредиент уникальна, поэтому число связей равно
+        # числу рецептов
         return super().get_queryset(request).annotate(
-            _recipes_count=Count('ingredient_amounts__recipe',
-                                 distinct=True)
+            _recipes_count=count_related(IngredientAmount, 'ingredient')
         )
 
     @admin.display(description='В рецептах', ordering='_recipes_count')
@@ -62,10 +165,16 @@ class TagAdmin(admin.ModelAdmin):
     search_fields = ('name', 'slug')
     ordering = ('name',)
 
-    @admin.display(description='Рецептов')
+    def get_queryset(self, request):
+        """Аннотируем queryset количеством рецептов"""
+        return super().get_queryset(request).annotate(
+            _recipes_count=count_related(Recipe.tags.through, 'tag')
+        )
+
+    @admin.display(description='Рецептов', ordering='_recipes_count')
     def get_recipes_count(self, count):
         """Показывает количество рецептов с этим тегом"""
-        return count.recipes.count()
+        return count._recipes_count
 
 
 class IngredientAmountInline(admin.TabularInline):
@@ -73,6 +182,12 @@ class IngredientAmountInline(admin.TabularInline):
     model = IngredientAmount
     extra = 1
     min_num = 1
+    # Список всех ингредиентов большой, выбираем через поиск
+    autocomplete_fields = ('ingredient',)
+
+    def get_queryset(self, request):
+        """Подгружаем ингредиенты вместе со связями рецепта"""
+        return super().get_queryset(request).select_related('ingredient')
 
 
 class CookingTimeFilter(admin.SimpleListFilter):
@@ -129,11 +244,15 @@ class AuthorUsernameFilter(admin.SimpleListFilter):
 
     def lookups(self, request, model_admin):
         """Возвращает список ников авторов"""
-        authors = User.objects.filter(
-            recipes__isnull=False
-        ).distinct().values_list('username', 'username')[:10]
-
-        return authors
+        # EXISTS вместо JOIN + DISTINCT: ники уникальны, дублей нет.
+        # Список кэшируется и сбрасывается при изменении рецептов
+        return cache.get_or_set(
+            AUTHOR_CHOICES_CACHE_KEY,
+            lambda: list(User.objects.filter(
+                Exists(Recipe.objects.filter(author=OuterRef('pk')))
+            ).order_by('username').values_list('username', 'username')[:10]),
+            AUTHOR_CHOICES_CACHE_TIMEOUT
+        )
 
     def queryset(self, request, queryset):
         """Фильтрует по выбранному нику автора"""
@@ -156,6 +275,9 @@ class RecipeAdmin(admin.ModelAdmin):
         'get_ingredients_column',
     )
     list_display_links = ('get_name_html',)
+    list_select_related = ('author',)
+    list_per_page = 50
+    show_full_result_count = False
     search_fields = ('name', 'author__email', 'author__username',
                      'ingredient_amounts__ingredient__name')
     list_filter = ('tags', 'created_at',
@@ -174,6 +296,28 @@ class RecipeAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        """Подгружаем связи и считаем избранное одним запросом"""
+        queryset = super().get_queryset(request).annotate(
+            _favorites_count=count_related(Favorite, 'recipe')
+        )
+        opts = self.model._meta
+        if (request.resolver_match.url_name
+                != f'{opts.app_label}_{opts.model_name}_changelist'):
+            return queryset
+        # В списке описание рецепта не выводится, читаем только
+        # отображаемые колонки
+        return queryset.prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredient_amounts',
+                queryset=IngredientAmount.objects.select_related('ingredient')
+            )
+        ).only(
+            'name', 'cooking_time', 'image', 'created_at',
+            'author', 'author__username'
+        )
+
     @admin.display(description='Рецепт')
     def get_name_html(self, recipe):
         """Красивое название рецепта с градиентом"""
@@ -196,12 +340,15 @@ class RecipeAdmin(admin.ModelAdmin):
     @admin.display(description='Продукты')
     def get_ingredients_column(self, recipe):
         """Показывает список ингредиентов рецепта"""
-        ingredients = recipe.ingredient_amounts.all()
-        return mark_safe('<br>'.join([
-            f'{ing.ingredient.name} '
-            f'({ing.amount} {ing.ingredient.measurement_unit})'
-            for ing in ingredients
-        ]))
+        lines = []
+        for ingredient_amount in recipe.ingredient_amounts.all():
+            ingredient = ingredient_amount.ingredient
+            lines.append(INGREDIENT_HTML_TEMPLATE % (
+                ingredient.name,
+                ingredient_amount.amount,
+                ingredient.measurement_unit
+            ))
+        return mark_safe('<br>'.join(lines))
 
     @admin.display(description='Автор')
     def author_username(self, recipe):
@@ -243,10 +390,11 @@ class RecipeAdmin(admin.ModelAdmin):
             f'</div>'
         )
 
-    @admin.display(description='Руйтинг/В избранном')
+    @admin.display(description='Руйтинг/В избранном',
+                   ordering='_favorites_count')
     def favorites_count(self, recipe):
         """Количество добавлений в избранное"""
-        favorites = recipe.favorite.count()
+        favorites = recipe._favorites_count
         if favorites > 10:
             color = "#ff6b6b"
             emoji = "🔥"
@@ -266,80 +414,37 @@ class RecipeAdmin(admin.ModelAdmin):
         if not tags:
             return 'Тег пока не добавлен!'
 
-        # Цветовая схема для конкретных тегов
-        tag_colors = {
-            'Завтрак': "#F4F80A",
-            'Обед': "#2BFF00",
-            'Перекус': "#00FFF7",
-            'Постное': "#44EC7C",
-            'Праздничное': "#FB03FF",
-            'Ужин': "#3A6BFE",
-            'Чаепитие': "#F48B62",
-        }
-
-        tags_html = []
-        for tag in tags:
-            color = tag_colors.get(tag.name, '#95a5a6')
-
-            tags_html.append(
-                f'<span style="background: {color}; color: #080707; '
-                f'padding: 4px 8px; border-radius: 16px; font-size: 12px; '
-                f'font-weight: 500; margin: 2px; display: inline-block; '
-                f'border: 1px solid {color};">'
-                f'{tag.name}</span>'
-            )
-
-        return mark_safe(' '.join(tags_html))
+        return mark_safe(' '.join(get_tag_html(tag.name) for tag in tags))
 
-    @mark_safe
     @admin.display(description='Изображения')
     def get_image_html(self, recipe):
         """Миниатюра изображения"""
         if recipe.image:
-            return (
-                f'<img src="{recipe.image.url}" '
-                f'style="height: 80px; width: 90px; object-fit: cover; '
-                f'border-radius: 4px; border: 5px solid #87CEEB;" '
-                f'title="{recipe.name}" '
-                f'onerror="this.style.display=\'none\'">'
-            )
+            return get_recipe_thumbnail_html(recipe.image.url, recipe.name)
         return 'Изображение не добавлено'
 
 
-@admin.register(Favorite)
-class FavoriteRecipeAdmin(admin.ModelAdmin):
+@admin.register(Favorite, ShoppingCart)
+class UserRecipeAdmin(admin.ModelAdmin):
     """Админка для избранного и списка покупок"""
     list_display = ('id', 'user', 'recipe', 'recipe_author')
     list_display_links = ('user', 'recipe')
-    search_fields = ('user__email', 'user__username', 'recipe__name')
-
-    @admin.display(description='Автор рецепта')
-    def recipe_author(self, recipe_instance):
-        return recipe_instance.recipe.author
-
-
-@admin.register(ShoppingCart)
-class ShoppingCartRecipeAdmin(admin.ModelAdmin):
-    """Админка для избранного и списка покупок"""
-    list_display = ('id', 'recipe_author', 'user', 'recipe')
-    list_display_links = ('user', 'recipe')
+    list_select_related = ('user', 'recipe__author')
     search_fields = ('user__email', 'user__username', 'recipe__name',
                      'recipe__author__first_name', 'recipe__author__last_name',
                      'recipe__author__username')
 
-    def get_queryset(self, request):
-        return super().get_queryset(request).select_related('recipe__author')
-
-    @admin.display(description='Автор')
+    @admin.display(description='Автор рецепта')
     def recipe_author(self, recipe_instance):
         author = recipe_instance.recipe.author
-        return author.get_full_name() or author.first_name
+        return author.get_full_name() or author.username
 
 
 @admin.register(Subscription)
 class SubscriptionAdmin(admin.ModelAdmin):
     """Админка для подписок"""
     list_display = ('user', 'author')
+    list_select_related = ('user', 'author')
     search_fields = ('user__username', 'user__email',
                      'author__username', 'author__email')
 
@@ -351,55 +456,58 @@ class UserAdmin(UserAdmin):
         'id', 'username', 'get_full_name', 'email', 'recipes_count',
         'following_count', 'followers_count', 'get_avatar_html')
     list_filter = ('is_superuser', 'is_active', 'groups')
+    show_full_result_count = False
     search_fields = ('username', 'email', 'first_name', 'last_name')
     ordering = ('username',)
     readonly_fields = ('avatar_preview',)
-
-    def get_fieldsets(self, request, obj=None):
-        fieldsets = super().get_fieldsets(request, obj)
-        if 'avatar' not in fieldsets[1][1]['fields']:
-            fieldsets[1][1]['fields'] = fieldsets[1][1]['fields'] + (
+    # Аватар добавляется к личным данным один раз при объявлении класса
+    fieldsets = (
+        UserAdmin.fieldsets[0],
+        (UserAdmin.fieldsets[1][0], {
+            **UserAdmin.fieldsets[1][1],
+            'fields': UserAdmin.fieldsets[1][1]['fields'] + (
                 'avatar_preview', 'avatar'
             )
-        return fieldsets
+        }),
+        *UserAdmin.fieldsets[2:],
+    )
+
+    def get_queryset(self, request):
+        """Аннотируем queryset количеством рецептов и подписок"""
+        return super().get_queryset(request).annotate(
+            _recipes_count=count_related(Recipe, 'author'),
+            _following_count=count_related(Subscription, 'author'),
+            _followers_count=count_related(Subscription, 'user')
+        )
 
-    @mark_safe
     @admin.display(description='Текущий аватар')
     def avatar_preview(self, obj):
         """Превью аватара в форме редактирования"""
         if obj.avatar:
-            return (
-                f'<img src="{obj.avatar.url}" style="max-height: 250px;'
-                f'max-width: 150px; border-radius: 50%; object-fit: cover;"/>'
-            )
+            return get_avatar_preview_html(obj.avatar.url)
 
-    @mark_safe
     @admin.display(description='Аватар')
     def get_avatar_html(self, user):
         """HTML-разметка для аватара"""
         if user.avatar:
-            return (
-                f'<img src="{user.avatar.url}" style="max-height: 120px;'
-                f'max-width: 120px; border-radius: 50%; object-fit: cover;'
-                f'border: 3px solid #8b5cf6;" />'
-            )
+            return get_avatar_thumbnail_html(user.avatar.url)
 
     @admin.display(description='ФИО')
     def get_full_name(self, user):
         """ФИО пользователя в одной колонке"""
         return f'{user.last_name} {user.first_name}'.strip()
 
-    @admin.display(description='Рецепты')
+    @admin.display(description='Рецепты', ordering='_recipes_count')
     def recipes_count(self, user):
         """Количество рецептов пользователя"""
-        return user.recipes.count()
+        return user._recipes_count
 
-    @admin.display(description='Подписки')
+    @admin.display(description='Подписки', ordering='_following_count')
     def following_count(self, user):
         """Количество подписок пользователя"""
-        return user.followings.count()
+        return user._following_count
 
-    @admin.display(description='Подписчики')
+    @admin.display(description='Подписчики', ordering='_followers_count')
     def followers_count(self, user):
         """Количество подписчиков пользователя"""
-        return user.followers.count()
+        return user._followers_count
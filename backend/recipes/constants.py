@@ -1,3 +1,18 @@
 # Константы
 MIN_COOKING_TIME = 1
 MIN_AMOUNT = 1
+BULK_CREATE_BATCH_SIZE = 500
+MAX_IMAGE_SIZE = 5 * 1024 * 1024
+ITERATOR_CHUNK_SIZE = 500
+# Длина base64 для изображения MAX_IMAGE_SIZE байт и запас
+# на заголовок data:image/...;base64,
+MAX_AVATAR_B64 = (MAX_IMAGE_SIZE + 2) // 3 * 4 + 64
+LIST_CACHE_TIMEOUT = 60 * 15
+TAGS_CACHE_VERSION_KEY = 'api_tags_version'
+INGREDIENTS_CACHE_VERSION_KEY = 'api_ingredients_version'
+SHORT_LINK_CACHE_TIMEOUT = 60
+RECIPE_EXISTS_CACHE_KEY = 'recipe_exists:{pk}'
+AUTHOR_CHOICES_CACHE_KEY = 'recipe_admin_author_choices'
+AUTHOR_CHOICES_CACHE_TIMEOUT = 60
+MEASUREMENT_UNIT_CHOICES_CACHE_KEY = 'ingredient_admin_unit_choices'
+MEASUREMENT_UNIT_CHOICES_CACHE_TIMEOUT = 60 * 5
@@ -1,3 +1,4 @@
+from recipes.constants import TAGS_CACHE_VERSION_KEY
 from recipes.models import Tag
 from management.utils.base_import_command import BaseImportCommand
 
@@ -7,3 +8,4 @@ class Command(BaseImportCommand):
 
     file_path = '/app/data/tags.json'
     model = Tag
+    cache_keys = (TAGS_CACHE_VERSION_KEY,)
@@ -1,3 +1,5 @@
+from recipes.constants import (INGREDIENTS_CACHE_VERSION_KEY,
+                               MEASUREMENT_UNIT_CHOICES_CACHE_KEY)
 from recipes.models import Ingredient
 from management.utils.base_import_command import BaseImportCommand
 
@@ -7,3 +9,6 @@ class Command(BaseImportCommand):
 
     file_path = '/app/data/ingredients.json'
     model = Ingredient
+    natural_key_fields = ('name', 'measurement_unit')
+    cache_keys = (INGREDIENTS_CACHE_VERSION_KEY,
+                  MEASUREMENT_UNIT_CHOICES_CACHE_KEY)
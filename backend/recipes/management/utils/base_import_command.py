@@ -1,12 +1,21 @@
 import json
+from django.core.cache import cache
 from django.core.management.base import BaseCommand
 
+from recipes.constants import BULK_CREATE_BATCH_SIZE
+
 
 class BaseImportCommand(BaseCommand):
     """Базовый класс для команд импорта данных"""
 
     file_path = None
     model = None
+    # Поля, по которым запись считается уже загруженной, если у модели
+    # нет ограничения уникальности для ignore_conflicts
+    natural_key_fields = None
+    # Ключи кэша, которые нужно сбросить после импорта: bulk_create
+    # не отправляет сигналы post_save
+    cache_keys = ()
     success_message = "Импорт завершен успешно"
 
     def handle(self, *args, **options):
@@ -15,15 +24,19 @@ class BaseImportCommand(BaseCommand):
         try:
             with open(self.file_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
+                existing_keys = self.get_existing_keys()
                 objects_to_create = [
                     self.model(**item)
                     for item in data
+                    if self.get_natural_key(item) not in existing_keys
                 ]
 
                 created_objects = self.model.objects.bulk_create(
                     objects_to_create,
-                    ignore_conflicts=True
+                    ignore_conflicts=True,
+                    batch_size=BULK_CREATE_BATCH_SIZE
                 )
+            cache.delete_many(self.cache_keys)
 
             self.stdout.write(self.style.SUCCESS(
                 f'Импорт из {self.file_path}: обработано {len(data)} записей, '
@@ -34,3 +47,17 @@ class BaseImportCommand(BaseCommand):
             self.stdout.write(self.style.ERROR(
                 f'Ошибка при загрузке файла {self.file_path}: {e}'
             ))
+
+    def get_natural_key(self, item):
+        """Ключ записи из файла для сравнения с уже загруженными"""
+        if not self.natural_key_fields:
+            return None
+        return tuple(item[field] for field in self.natural_key_fields)
+
+    def get_existing_keys(self):
+        """Ключи уже загруженных записей, читаются одним запросом"""
+        if not self.natural_key_fields:
+            return set()
+        return set(
+            self.model.objects.values_list(*self.natural_key_fields)
+        )
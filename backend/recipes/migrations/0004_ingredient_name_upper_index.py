@@ -0,0 +1,34 @@
+from django.db import migrations
+
+INDEX_NAME = 'recipes_ingredient_name_upper_idx'
+
+
+def create_name_index(apps, schema_editor):
+    """
+    Индекс для поиска ингредиентов по началу названия.
+    istartswith в PostgreSQL компилируется в UPPER(name) LIKE 'X%',
+    обычный btree по name для такого условия не используется.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} '
+        'ON recipes_ingredient (UPPER(name) text_pattern_ops)'
+    )
+
+
+def drop_name_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_alter_favorite_recipe_alter_favorite_user_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_name_index, drop_name_index),
+    ]
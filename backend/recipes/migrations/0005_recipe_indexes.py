@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-15 22:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_ingredient_name_upper_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-created_at'], name='recipes_rec_created_57db65_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['cooking_time'], name='recipes_rec_cooking_bf57fb_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-15 22:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0005_recipe_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['name', 'measurement_unit'], name='recipes_ing_name_cc3717_idx'),
+        ),
+    ]
@@ -106,6 +106,9 @@ class Ingredient(models.Model):
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ('name',)
+        indexes = (
+            models.Index(fields=('name', 'measurement_unit')),
+        )
 
     def __str__(self):
         return f'{self.name} ({self.measurement_unit})'
@@ -168,6 +171,10 @@ class Recipe(models.Model):
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-created_at',)
+        indexes = (
+            models.Index(fields=('-created_at',)),
+            models.Index(fields=('cooking_time',)),
+        )
 
     def __str__(self):
         return self.name
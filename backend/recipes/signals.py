@@ -0,0 +1,39 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .constants import (AUTHOR_CHOICES_CACHE_KEY,
+                        INGREDIENTS_CACHE_VERSION_KEY,
+                        MEASUREMENT_UNIT_CHOICES_CACHE_KEY,
+                        RECIPE_EXISTS_CACHE_KEY, TAGS_CACHE_VERSION_KEY)
+from .models import Ingredient, Recipe, Tag
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def reset_author_choices(sender, **kwargs):
+    """Сбрасывает кэш авторов для фильтра админки рецептов"""
+    cache.delete(AUTHOR_CHOICES_CACHE_KEY)
+
+
+@receiver(post_delete, sender=Recipe)
+def reset_recipe_exists(sender, instance, **kwargs):
+    """Сбрасывает кэш проверки существования удаленного рецепта"""
+    cache.delete(RECIPE_EXISTS_CACHE_KEY.format(pk=instance.pk))
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def reset_measurement_unit_choices(sender, **kwargs):
+    """Сбрасывает кэш единиц измерения для фильтра админки ингредиентов"""
+    cache.delete(MEASUREMENT_UNIT_CHOICES_CACHE_KEY)
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def reset_tags_cache(sender, **kwargs):
+    """Сбрасывает версию кэша ответов API с тегами"""
+    cache.delete(TAGS_CACHE_VERSION_KEY)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def reset_ingredients_cache(sender, **kwargs):
+    """Сбрасывает версию кэша ответов API с ингредиентами"""
+    cache.delete(INGREDIENTS_CACHE_VERSION_KEY)
@@ -0,0 +1,17 @@
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_related(model, field):
+    """
+    Количество связанных записей коррелированным подзапросом.
+    В отличие от Count() через JOIN такая аннотация не попадает
+    в COUNT(*) пагинатора и считается только для строк страницы.
+    """
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            count=Count('pk')
+        ).values('count')
+    ), 0)
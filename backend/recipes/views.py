@@ -1,12 +1,26 @@
+from django.core.cache import cache
 from django.shortcuts import redirect
 from django.http import Http404
 
+from .constants import RECIPE_EXISTS_CACHE_KEY, SHORT_LINK_CACHE_TIMEOUT
 from .models import Recipe
 
 
-def recipe_short_link(request, pk):
-    """Перенаправление с короткой ссылки на полный рецепт"""
+def check_recipe_exists(pk):
+    """Проверяет, что рецепт существует, иначе 404"""
+    # Кэшируем только существующие рецепты: только что созданный
+    # рецепт не должен получать 404 из устаревшего кэша
+    cache_key = RECIPE_EXISTS_CACHE_KEY.format(pk=pk)
+    if cache.get(cache_key):
+        return
     if not Recipe.objects.filter(id=pk).exists():
         raise Http404(f'Рецепт с id {pk} не найден')
+    cache.set(cache_key, True, SHORT_LINK_CACHE_TIMEOUT)
+
 
+def recipe_short_link(request, pk):
+    """Перенаправление с короткой ссылки на полный рецепт"""
+    # Ссылка ведет на страницу фронтенда, поэтому несуществующий
+    # рецепт отсекаем здесь
+    check_recipe_exists(pk)
     return redirect(f'/recipes/{pk}/')